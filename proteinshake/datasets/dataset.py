@@ -570,8 +570,9 @@ class Dataset():
         """
         from proteinshake.representations import SequenceDataset 
         proteins = self.proteins(resolution=resolution)
-        return SequenceDataset(Generator((transform(p) for p in proteins), len(proteins)),
+        return SequenceDataset(proteins,
                                self.root,
                                self.name,
+                               transform=transform,
                                verbosity=self.verbosity,
                                **kwargs)
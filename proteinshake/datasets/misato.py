@@ -1,6 +1,6 @@
-import requests, glob, json, os, tarfile
+import requests, json, os, tarfile, shutil, subprocess
 import pandas as pd
-from joblib import Parallel, delayed
+from joblib import Parallel, delayed, effective_n_jobs
 
 from proteinshake.datasets import Dataset
 from proteinshake.utils import download_url, unzip_file, error, warning, progressbar
@@ -30,15 +30,35 @@ class MisatoProteinLigandDataset(Dataset):
         Whether to include molecular dynamics trajectory data.
     """
 
+    # parsed misato_db.csv per path, shared by all instances (and reused across jobs in a joblib worker)
+    _metadata_cache = {}
+
     def __init__(self, subset='train', include_md=False, **kwargs):
         self.subset = subset
         self.include_md = include_md
         self.zenodo_base_url = 'https://zenodo.org/records/7711953/files'
+        self._file_cache = {}
         super().__init__(**kwargs)
 
+    def __getstate__(self):
+        # the file listings can hold every PDB path, don't pickle them into each parallel parsing job
+        state = self.__dict__.copy()
+        state['_file_cache'] = {}
+        return state
+
+    def find_files(self, extension):
+        """Returns all files with the given extension below the files directory. The directory is walked once per extension and cached until the next download or extraction."""
+        if extension not in self._file_cache:
+            files = []
+            for dirpath, dirnames, filenames in os.walk(f'{self.root}/raw/files'):
+                dirnames[:] = [d for d in dirnames if not d.startswith('.')] # skip hidden files and directories like glob
+                files.extend(os.path.join(dirpath, f) for f in filenames if f.endswith(extension) and not f.startswith('.'))
+            self._file_cache[extension] = files
+        return self._file_cache[extension]
+
     def get_raw_files(self):
         """Returns list of PDB files from the downloaded MISATO dataset."""
-        return glob.glob(f'{self.root}/raw/files/**/*.pdb', recursive=True)
+        return self.find_files('.pdb')
 
     def get_id_from_filename(self, filename):
         """Extract protein ID from filename."""
@@ -84,19 +104,29 @@ class MisatoProteinLigandDataset(Dataset):
 
         # Download files
         for filename in progressbar(files_to_download, desc='Downloading MISATO files', verbosity=self.verbosity):
+            out_path = f'{self.root}/raw/{filename}'
+            if os.path.exists(out_path) and os.path.getsize(out_path) > 0:
+                continue # already downloaded completely in a previous run
             try:
+                # download to a temporary file so an interrupted download is never mistaken for a complete one
                 download_url(f'{self.zenodo_base_url}/{filename}', 
-                           f'{self.root}/raw/', 
+                           f'{out_path}.part', 
                            verbosity=self.verbosity)
+                os.replace(f'{out_path}.part', out_path)
             except Exception as e:
                 warning(f'Failed to download {filename}: {e}', verbosity=self.verbosity)
 
-        # Extract tar.gz files
-        for filename in files_to_download:
-            if filename.endswith('.tar.gz'):
-                tar_path = f'{self.root}/raw/{filename}'
-                if os.path.exists(tar_path):
-                    self._extract_tar_gz(tar_path)
+        # Extract tar.gz files, each archive into its own directory so parallel jobs never write to the same paths
+        tar_paths = [f'{self.root}/raw/{filename}' for filename in files_to_download if filename.endswith('.tar.gz')]
+        tar_paths = [tar_path for tar_path in tar_paths if os.path.exists(tar_path)]
+        if len(tar_paths) > 0:
+            # download() only runs before done.txt exists, so anything already extracted is left over from an interrupted run
+            shutil.rmtree(f'{self.root}/raw/files', ignore_errors=True)
+            os.makedirs(f'{self.root}/raw/files', exist_ok=True)
+            n_jobs = min(len(tar_paths), effective_n_jobs(self.n_jobs))
+            threads = max(1, (os.cpu_count() or 1) // n_jobs) # share the cores between the pigz processes
+            Parallel(n_jobs=n_jobs)(delayed(self._extract_tar_gz)(tar_path, threads=threads) for tar_path in tar_paths)
+        self._file_cache.clear()
                     
         # Check if any PDB files were extracted
         pdb_files = self.get_raw_files()
@@ -104,42 +134,71 @@ class MisatoProteinLigandDataset(Dataset):
             warning('No PDB files found after extraction. Please check the dataset structure.', 
                    verbosity=self.verbosity)
 
-    def _extract_tar_gz(self, tar_path):
-        """Extract tar.gz file to the files directory."""
+    def _extract_tar_gz(self, tar_path, threads=None):
+        """Extract tar.gz file to its own subdirectory of the files directory. Decompresses with pigz (using `threads` threads, default all cores) if it is installed."""
+        out_path = f'{self.root}/raw/files/{os.path.basename(tar_path)[:-len(".tar.gz")]}/'
         try:
-            with tarfile.open(tar_path, 'r:gz') as tar:
-                tar.extractall(path=f'{self.root}/raw/files/')
+            shutil.rmtree(out_path, ignore_errors=True) # never mix with a partial earlier extraction
+            os.makedirs(out_path, exist_ok=True)
+            if shutil.which('pigz'):
+                # stream the decompressed archive into tarfile, which then reads it sequentially
+                command = ['pigz', '-dc'] + ([] if threads is None else ['-p', str(threads)]) + [tar_path]
+                with subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE) as proc:
+                    try:
+                        with tarfile.open(fileobj=proc.stdout, mode='r|') as tar:
+                            tar.extractall(path=out_path)
+                        # tarfile stops at the end-of-archive marker, drain the rest so pigz is not killed by SIGPIPE
+                        while proc.stdout.read(1024*1024): pass
+                    except tarfile.TarError as e:
+                        proc.stdout.close() # unblocks pigz if it is still writing
+                        raise RuntimeError(f'{e}: {proc.stderr.read().decode(errors="replace").strip()}') from e
+                    stderr = proc.stderr.read().decode(errors='replace').strip()
+                if proc.returncode != 0:
+                    raise RuntimeError(f'pigz exited with code {proc.returncode}: {stderr}')
+            else:
+                with tarfile.open(tar_path, 'r:gz') as tar:
+                    tar.extractall(path=out_path)
+            self._file_cache.clear()
             if self.verbosity > 1:
                 print(f'Extracted {os.path.basename(tar_path)}')
         except Exception as e:
             warning(f'Failed to extract {tar_path}: {e}', verbosity=self.verbosity)
 
+    def load_metadata(self, metadata_path):
+        """Load the metadata table once and turn it into a mapping from ID to protein attributes."""
+        if metadata_path not in self._metadata_cache:
+            metadata = pd.read_csv(metadata_path).drop_duplicates('ID') # keep the first row per ID
+            metadata = metadata[metadata['ID'].notna()]
+            # binding affinity and ligand are always added if present, the other columns only where not missing
+            renames = {'affinity': 'binding_affinity'}
+            always = [col for col in ['affinity', 'ligand_smiles'] if col in metadata.columns]
+            optional = [col for col in ['resolution', 'r_work', 'r_free', 'method'] if col in metadata.columns]
+            table = metadata.set_index('ID')[always + optional].rename(columns=renames)
+            attributes = {
+                metadata_id: {k: v for k, v in row.items() if k not in optional or pd.notna(v)}
+                for metadata_id, row in table.to_dict('index').items()
+            }
+            # fallback matches for IDs without an exact match, filled lazily per ID
+            fallback = {}
+            self._metadata_cache[metadata_path] = (attributes, metadata['ID'], fallback)
+        return self._metadata_cache[metadata_path]
+
     def add_protein_attributes(self, protein_dict):
         """Add MISATO-specific attributes to protein dictionary."""
         # Load metadata if available
         metadata_path = f'{self.root}/raw/misato_db.csv'
         if os.path.exists(metadata_path):
             try:
-                metadata = pd.read_csv(metadata_path)
+                attributes, ids, fallback = self.load_metadata(metadata_path)
                 protein_id = protein_dict['protein']['ID']
                 
-                # Find matching entry in metadata
-                matching_rows = metadata[metadata['ID'].str.contains(protein_id, na=False)]
-                if not matching_rows.empty:
-                    row = matching_rows.iloc[0]
-                    
-                    # Add binding affinity if available
-                    if 'affinity' in row:
-                        protein_dict['protein']['binding_affinity'] = row['affinity']
-                    
-                    # Add ligand information if available
-                    if 'ligand_smiles' in row:
-                        protein_dict['protein']['ligand_smiles'] = row['ligand_smiles']
-                    
-                    # Add other available metadata
-                    for col in ['resolution', 'r_work', 'r_free', 'method']:
-                        if col in row and pd.notna(row[col]):
-                            protein_dict['protein'][col] = row[col]
+                # Find matching entry in metadata, exact ID first, the first ID containing it as a fallback
+                if not protein_id in attributes:
+                    if not protein_id in fallback:
+                        matching_ids = ids[ids.str.contains(protein_id, na=False, regex=False)]
+                        fallback[protein_id] = matching_ids.iloc[0] if not matching_ids.empty else None
+                    protein_id = fallback[protein_id]
+                protein_dict['protein'].update(attributes.get(protein_id, {}))
                             
             except Exception as e:
                 warning(f'Failed to load metadata for {protein_dict["protein"]["ID"]}: {e}', 
@@ -149,13 +208,13 @@ class MisatoProteinLigandDataset(Dataset):
 
     def get_ligand_files(self):
         """Get ligand structure files if available."""
-        return glob.glob(f'{self.root}/raw/files/**/*.sdf', recursive=True)
+        return self.find_files('.sdf')
 
     def get_md_files(self):
         """Get molecular dynamics trajectory files if available."""
         if not self.include_md:
             return []
-        return glob.glob(f'{self.root}/raw/files/**/*.xtc', recursive=True)
+        return self.find_files('.xtc')
     
     def debug_structure(self):
         """Debug method to show the structure of downloaded files."""
@@ -1,9 +1,17 @@
 import os
+import itertools
 from tqdm import tqdm
 import numpy as np
 import torch
 
-from proteinshake.utils import tokenize
+from proteinshake.utils import tokenize, save, load, fx2str, error
+from proteinshake.utils.embeddings import residue_alphabet
+
+
+# token -> ascii byte, inverse of the residue tokenizer
+residue_bytes = np.frombuffer(residue_alphabet.encode('ascii'), dtype=np.uint8)
+# number of proteins tokenized at once when building a SequenceDataset, bounds the memory of the build
+chunk_size = 1024
 
 
 class Sequence:
@@ -33,26 +41,75 @@ class SequenceDataset:
         Number of proteins in the dataset.
     path : str
         Path to save the processed dataset.
+    transform : function, default None
+        A transform applied to each protein before its sequence is tokenized.
+
+    Tokens of all proteins are written once to flat ``int8`` memory-mapped files under `path` and reopened on subsequent runs, so multiple DataLoader workers share the same pages. Delete the folder to rebuild them, e.g. with a different transform.
+    If an embedding layer requires ``long`` indices, cast per batch, e.g. in a ``collate_fn``:
+
+    .. code-block:: python
+
+        >>> from torch.nn.utils.rnn import pad_sequence
+        >>> def collate_fn(batch):
+        ...     return pad_sequence([b['sequence'] for b in batch], batch_first=True).long()
     """
 
-    def __init__(self, proteins, root, name, verbosity=2):
+    def __init__(self, proteins, root, name, transform=None, verbosity=2):
         self.verbosity = verbosity
         self.path = f'{root}/processed/sequence/{name}'
-        self.sequences = list(Sequence(protein) for protein in tqdm(proteins, total=len(proteins)))
-        self.size = len(self.sequences)
-        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        os.makedirs(self.path, exist_ok=True)
+        tokens_path, offsets_path = f'{self.path}/tokens.i8', f'{self.path}/offsets.i64'
+        transforms_repr = fx2str(transform)
+        size = len(proteins)
+        # tokens of all proteins are packed into one flat array, protein i spans offsets[i]:offsets[i+1]
+        # the offsets file is written last and marks a complete dataset
+        if not os.path.exists(offsets_path):
+            if not transform is None:
+                proteins = (transform(protein) for protein in proteins)
+            proteins = iter(tqdm(proteins, total=size))
+            lengths = []
+            with open(tokens_path, 'wb') as file:
+                while True:
+                    sequences = [protein['protein']['sequence'] for protein in itertools.islice(proteins, chunk_size)]
+                    if len(sequences) == 0: break
+                    # tokenize a chunk of proteins in a single lookup over the concatenated sequences and append it to the file
+                    # a 20 letter alphabet fits in int8, cast to long per batch only if the model requires it
+                    tokenize(''.join(sequences), resolution='residue', dtype=np.int8).tofile(file)
+                    lengths.extend(len(sequence) for sequence in sequences)
+            offsets = np.zeros(len(lengths)+1, dtype=np.int64)
+            np.cumsum(lengths, out=offsets[1:])
+            save(transforms_repr, f'{self.path}/transforms.pkl')
+            offsets.tofile(offsets_path)
+        self.offsets = np.fromfile(offsets_path, dtype=np.int64)
+        if self.offsets[-1] > 0:
+            # copy-on-write keeps the file read-only while handing out writable arrays to torch.from_numpy
+            self.tokens_flat = np.memmap(tokens_path, dtype=np.int8, mode='c', shape=(self.offsets[-1],))
+        else:
+            self.tokens_flat = np.empty(0, dtype=np.int8)
+        self.size = len(self.offsets) - 1
+        if not load(f'{self.path}/transforms.pkl') == transforms_repr: error(f'The transform is not the same as when the dataset was created. If you want to change it, delete the folder at {self.path}', verbosity=self.verbosity)
+        if not self.size == size: error(f'The number of proteins ({size}) does not match the stored dataset ({self.size}). Delete the folder at {self.path} to rebuild it.', verbosity=self.verbosity)
+
+    def __len__(self):
+        return self.size
+
+    def _tokens(self, idx):
+        return self.tokens_flat[self.offsets[idx]:self.offsets[idx+1]]
 
     def __getitem__(self, idx):
-        seq = self.sequences[idx]
+        if idx < 0:
+            idx += self.size
+        if not 0 <= idx < self.size:
+            raise IndexError(f'Index out of range for dataset of size {self.size}.')
         return {
-            'sequence': torch.tensor(seq.tokens, dtype=torch.long),
+            'sequence': torch.from_numpy(self._tokens(idx)),
             'id': idx,
         }
 
     def strings(self):
         """ Returns all sequences as plain amino acid strings. """
-        return [seq.sequence for seq in self.sequences]
+        return [residue_bytes[self._tokens(i)].tobytes().decode('ascii') for i in range(self.size)]
 
     def numpy(self):
-        """ Returns all tokenized sequences as a list of NumPy arrays. """
-        return [seq.tokens for seq in self.sequences]
+        """ Returns all tokenized sequences as a list of NumPy arrays (views into the flat token array). """
+        return [self._tokens(i) for i in range(self.size)]
@@ -9,6 +9,12 @@ import numpy as np
 residue_alphabet = 'ARNDCEQGHILKMFPSTWYV'
 atom_alphabet = 'NCOSH'
 
+# byte -> token lookup table, -1 marks characters outside the alphabet
+residue_lut = np.full(256, -1, dtype=np.int8)
+residue_lut[np.frombuffer(residue_alphabet.encode('ascii'), dtype=np.uint8)] = np.arange(len(residue_alphabet))
+atom_lut = np.full(256, -1, dtype=np.int8)
+atom_lut[np.frombuffer(atom_alphabet.encode('ascii'), dtype=np.uint8)] = np.arange(len(atom_alphabet))
+
 def onehot(sequence, resolution='residue'):
     """ Compute the one-hot encoding of a protein sequence.
 
@@ -31,7 +37,7 @@ def onehot(sequence, resolution='residue'):
 
 
 
-def tokenize(sequence, resolution='residue'):
+def tokenize(sequence, resolution='residue', dtype=np.int64):
     """ Tokenizes the sequence.
 
     Parameters
@@ -40,6 +46,8 @@ def tokenize(sequence, resolution='residue'):
         The protein sequence.
     resolution: str, default 'resolution'
         Resolution of the protein. 'residue' or 'atom'.
+    dtype: type, default np.int64
+        Integer type of the returned tokens. Both alphabets fit in np.int8.
 
     Returns
     -------
@@ -47,9 +55,20 @@ def tokenize(sequence, resolution='residue'):
         The embedded sequence.
     """
     if resolution == 'residue':
-        return np.array([residue_alphabet.index(aa) for aa in sequence])
+        if not isinstance(sequence, str):
+            sequence = ''.join(sequence)
+        tokens = residue_lut[np.frombuffer(sequence.encode('ascii'), dtype=np.uint8)]
+        if (tokens < 0).any():
+            raise ValueError(f'Sequence contains residues outside of the alphabet {residue_alphabet}.')
+        return tokens.astype(dtype, copy=False)
     else:
-        return np.array([atom_alphabet.index(aa[0]) for aa in sequence])
+        if isinstance(sequence, str):
+            sequence = list(sequence)
+        # casting to S1 keeps only the first letter of each atom name, which is the element
+        tokens = atom_lut[np.asarray(sequence, dtype='S1').view(np.uint8)]
+        if (tokens < 0).any():
+            raise ValueError(f'Sequence contains atoms outside of the alphabet {atom_alphabet}.')
+        return tokens.astype(dtype, copy=False)
 
 # from: https://gist.github.com/foowaa/5b20aebd1dff19ee024b6c72e14347bb
 def sinusoid_encoding_table(n_position, d_hid, padding_idx=None):
@@ -10,6 +10,7 @@ import gzip
 import shutil
 import requests
 import re
+import types
 import warnings
 import pandas as pd
 import numpy as np
@@ -52,6 +53,8 @@ class Generator(object):
 def fx2str(fx):
     """ Converts a function to a string representation.
 
+    Callable objects include their attributes, such that two instances of the same transform with different parameters are distinguished.
+
     Parameters
     ----------
     fx: function
@@ -62,6 +65,13 @@ def fx2str(fx):
     str
         The stringified function.
     """
+    if isinstance(fx, (list, tuple)):
+        return '[{}]'.format(', '.join(fx2str(x) for x in fx))
+    if isinstance(fx, dict):
+        return '{{{}}}'.format(', '.join(f'{k}: {fx2str(v)}' for k, v in sorted(fx.items(), key=lambda item: str(item[0]))))
+    if not isinstance(fx, (type, types.FunctionType, types.MethodType, types.ModuleType)) and getattr(fx, '__dict__', None):
+        params = ', '.join(f'{k}={fx2str(v)}' for k, v in sorted(vars(fx).items()))
+        return f'{type(fx).__module__}.{type(fx).__qualname__}({params})'
     return re.sub('(<.*?)\\s.*(>)', r'\1\2', fx.__repr__())
 
 def avro_schema_from_protein(protein):
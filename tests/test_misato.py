@@ -0,0 +1,182 @@
+'''
+Tests the MISATO metadata lookup on a small mock misato_db.csv.
+'''
+
+import io, os, gzip, shutil, stat, pickle, tarfile, unittest, unittest.mock, tempfile
+
+from proteinshake.datasets import MisatoProteinLigandDataset
+from proteinshake.utils.io import avro_schema_from_protein
+
+METADATA = '''ID,affinity,ligand_smiles,resolution,r_work,r_free,method
+10GS,6.4,CCO,2.2,0.18,,X-RAY
+10GS,1.0,C,1.0,0.1,0.2,NMR
+2XYZ1,3.1,CCN,,0.2,0.25,X-RAY
+12XYZ,4.0,CCC,1.5,0.21,0.26,X-RAY
+'''
+
+def mock_dataset(root, **kwargs):
+    # skip __init__, which would download the dataset
+    ds = MisatoProteinLigandDataset.__new__(MisatoProteinLigandDataset)
+    ds.root = root
+    ds.verbosity = 0
+    ds.subset = 'train'
+    ds.include_md = False
+    ds.n_jobs = 1
+    ds.zenodo_base_url = 'https://zenodo.org/records/7711953/files'
+    ds._file_cache = {}
+    for k, v in kwargs.items():
+        setattr(ds, k, v)
+    return ds
+
+def write_tar_gz(path, files, padding=0):
+    buffer = io.BytesIO()
+    with tarfile.open(fileobj=buffer, mode='w') as tar:
+        for name, content in files.items():
+            info = tarfile.TarInfo(name)
+            info.size = len(content)
+            tar.addfile(info, io.BytesIO(content))
+    # trailing zeros after the end-of-archive marker, as left by some archivers
+    with gzip.open(path, 'wb') as file:
+        file.write(buffer.getvalue() + b'\0' * padding)
+
+def write_executable(path, script):
+    with open(path, 'w') as file:
+        file.write(script)
+    os.chmod(path, os.stat(path).st_mode | stat.S_IEXEC)
+
+def touch(path):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    open(path, 'w').close()
+
+
+class TestMisatoMetadata(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        os.makedirs(f'{self.tmpdir.name}/raw')
+        with open(f'{self.tmpdir.name}/raw/misato_db.csv', 'w') as file:
+            file.write(METADATA)
+        self.ds = mock_dataset(self.tmpdir.name)
+
+    def tearDown(self):
+        MisatoProteinLigandDataset._metadata_cache.clear()
+        self.tmpdir.cleanup()
+
+    def annotate(self, protein_id):
+        return self.ds.add_protein_attributes({'protein': {'ID': protein_id}})['protein']
+
+    def test_exact_id_first_row(self):
+        protein = self.annotate('10GS')
+        self.assertEqual(protein['binding_affinity'], 6.4)
+        self.assertEqual(protein['ligand_smiles'], 'CCO')
+        self.assertEqual(protein['resolution'], 2.2)
+        self.assertEqual(protein['method'], 'X-RAY')
+        self.assertNotIn('r_free', protein) # missing optional column is skipped
+
+    def test_substring_fallback_order(self):
+        protein = self.annotate('XYZ')
+        self.assertEqual(protein['binding_affinity'], 3.1) # 2XYZ1 comes before 12XYZ
+        self.assertNotIn('resolution', protein)
+        self.assertEqual(protein['r_free'], 0.25)
+
+    def test_no_match(self):
+        self.assertEqual(self.annotate('9ZZZ'), {'ID': '9ZZZ'})
+
+    def test_native_types(self):
+        protein = self.annotate('12XYZ')
+        for key in ['binding_affinity', 'resolution', 'r_work', 'r_free']:
+            self.assertIs(type(protein[key]), float)
+        self.assertIs(type(protein['ligand_smiles']), str)
+        avro_schema_from_protein({'protein': protein})
+
+
+class TestMisatoFiles(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.root = self.tmpdir.name
+        os.makedirs(f'{self.root}/raw/files')
+        self.ds = mock_dataset(self.root)
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_cache_reused(self):
+        touch(f'{self.root}/raw/files/a/1abc.pdb')
+        self.assertEqual(len(self.ds.get_raw_files()), 1)
+        touch(f'{self.root}/raw/files/a/2abc.pdb')
+        self.assertEqual(len(self.ds.get_raw_files()), 1)
+
+    def test_extraction_invalidates(self):
+        self.assertEqual(self.ds.get_raw_files(), [])
+        write_tar_gz(f'{self.root}/raw/train_set.tar.gz', {'1abc.pdb': b'ATOM'})
+        self.ds._extract_tar_gz(f'{self.root}/raw/train_set.tar.gz')
+        self.assertEqual([os.path.basename(f) for f in self.ds.get_raw_files()], ['1abc.pdb'])
+
+    def test_download_invalidates(self):
+        self.assertEqual(self.ds.get_raw_files(), [])
+        # pre-placed files are not downloaded again
+        write_tar_gz(f'{self.root}/raw/train_set.tar.gz', {'1abc.pdb': b'ATOM'})
+        with open(f'{self.root}/raw/misato_db.csv', 'w') as file:
+            file.write(METADATA)
+        self.ds.download()
+        self.assertEqual([os.path.basename(f) for f in self.ds.get_raw_files()], ['1abc.pdb'])
+
+    def test_parallel_extraction(self):
+        write_tar_gz(f'{self.root}/raw/train_set.tar.gz', {'train/1abc.pdb': b'ATOM', 'train/2abc.pdb': b'ATOM'})
+        write_tar_gz(f'{self.root}/raw/MD_train_set.tar.gz', {'md/1abc.xtc': b''})
+        write_tar_gz(f'{self.root}/raw/QM_train_set.tar.gz', {'qm/1abc.pdb': b'ATOM'})
+        with open(f'{self.root}/raw/misato_db.csv', 'w') as file:
+            file.write(METADATA)
+        touch(f'{self.root}/raw/files/train/1abc.pdb') # flat leftover of an interrupted run
+        ds = mock_dataset(self.root, include_md=True, n_jobs=2)
+        # no pigz on PATH, use the tarfile path
+        with unittest.mock.patch.dict(os.environ, {'PATH': self.tmpdir.name}):
+            ds.download()
+        files = sorted(os.path.relpath(f, f'{self.root}/raw/files') for f in ds.get_raw_files())
+        self.assertEqual(files, [
+            'QM_train_set/qm/1abc.pdb',
+            'train_set/train/1abc.pdb',
+            'train_set/train/2abc.pdb',
+        ])
+        self.assertEqual([os.path.basename(f) for f in ds.get_md_files()], ['1abc.xtc'])
+
+    def fake_pigz(self, script):
+        bin_dir = f'{self.root}/bin'
+        os.makedirs(bin_dir, exist_ok=True)
+        write_executable(f'{bin_dir}/pigz', script)
+        return unittest.mock.patch.dict(os.environ, {'PATH': bin_dir + os.pathsep + os.environ.get('PATH', '')})
+
+    @unittest.skipIf(shutil.which('gzip') is None, 'needs gzip for the pigz shim')
+    def test_pigz_extraction(self):
+        # more padding than a pipe buffer, so pigz is still writing when tarfile is done
+        write_tar_gz(f'{self.root}/raw/train_set.tar.gz', {'train/1abc.pdb': b'ATOM'}, padding=4*1024*1024)
+        with self.fake_pigz('#!/bin/sh\nfor last; do :; done\nexec gzip -dc "$last"\n'):
+            with unittest.mock.patch('proteinshake.datasets.misato.warning') as warning:
+                self.ds._extract_tar_gz(f'{self.root}/raw/train_set.tar.gz', threads=2)
+        warning.assert_not_called()
+        self.assertEqual([os.path.basename(f) for f in self.ds.get_raw_files()], ['1abc.pdb'])
+
+    def test_pigz_failure(self):
+        write_tar_gz(f'{self.root}/raw/train_set.tar.gz', {'train/1abc.pdb': b'ATOM'})
+        with self.fake_pigz('#!/bin/sh\necho "pigz: corrupted input" >&2\nexit 1\n'):
+            with unittest.mock.patch('proteinshake.datasets.misato.warning') as warning:
+                self.ds._extract_tar_gz(f'{self.root}/raw/train_set.tar.gz')
+        warning.assert_called_once()
+        self.assertIn('pigz: corrupted input', warning.call_args[0][0])
+
+    def test_hidden_files_skipped(self):
+        touch(f'{self.root}/raw/files/a/1abc.pdb')
+        touch(f'{self.root}/raw/files/a/._1abc.pdb')
+        touch(f'{self.root}/raw/files/.hidden/2abc.pdb')
+        self.assertEqual([os.path.basename(f) for f in self.ds.get_raw_files()], ['1abc.pdb'])
+
+    def test_getstate_drops_cache(self):
+        touch(f'{self.root}/raw/files/a/1abc.pdb')
+        self.ds.get_raw_files()
+        self.assertEqual(pickle.loads(pickle.dumps(self.ds))._file_cache, {})
+        self.assertIn('.pdb', self.ds._file_cache)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,10 +1,16 @@
 import os
 import unittest
+import unittest.mock
 import tempfile
 import numpy as np
+import torch
+from torch.nn.utils.rnn import pad_sequence
 
 from proteinshake.datasets import RCSBDataset
+from proteinshake.representations import SequenceDataset
 from proteinshake.transforms import IdentityTransform
+from proteinshake.utils import tokenize, Generator
+from proteinshake.utils.embeddings import residue_alphabet, atom_alphabet
 
 
 class TestSequenceRepresentation(unittest.TestCase):
@@ -46,6 +52,108 @@ class TestSequenceRepresentation(unittest.TestCase):
         for s, t in zip(strings, tokens):
             self.assertEqual(len(s), len(t))
 
+    def test_getitem_dtype(self):
+        seq_ds = self.dataset.to_sequence(transform=IdentityTransform())
+        item = seq_ds[0]
+        self.assertEqual(item['sequence'].dtype, torch.int8)
+        self.assertEqual(item['sequence'].tolist(), tokenize(seq_ds.strings()[0]).tolist())
+
+    def test_collate_long(self):
+        seq_ds = self.dataset.to_sequence(transform=IdentityTransform())
+        batch = [seq_ds[i] for i in range(min(4, len(seq_ds)))]
+        padded = pad_sequence([b['sequence'] for b in batch], batch_first=True).long()
+        self.assertEqual(padded.dtype, torch.long)
+        self.assertEqual(padded.shape, (len(batch), max(len(b['sequence']) for b in batch)))
+        for row, b in zip(padded, batch):
+            self.assertEqual(row[:len(b['sequence'])].tolist(), b['sequence'].tolist())
+
+    def test_reopen(self):
+        first = self.dataset.to_sequence(transform=IdentityTransform())
+        second = self.dataset.to_sequence(transform=IdentityTransform())
+        self.assertTrue(os.path.exists(f'{second.path}/tokens.i8'))
+        self.assertIsInstance(second.tokens_flat, np.memmap)
+        np.testing.assert_array_equal(first.offsets, second.offsets)
+        np.testing.assert_array_equal(first.tokens_flat, second.tokens_flat)
+        self.assertEqual(first.strings(), second.strings())
+
+
+class TruncateTransform:
+    """ Keeps only the first `n` residues of a sequence. """
+
+    def __init__(self, n=3):
+        self.n = n
+
+    def __call__(self, protein):
+        protein['protein']['sequence'] = protein['protein']['sequence'][:self.n]
+        return protein
+
+
+def mock_proteins(sequences):
+    return Generator(({'protein': {'sequence': s}} for s in sequences), len(sequences))
+
+
+class TestSequenceDataset(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.sequences = ['MKVLA', 'GCSSWY', 'HNRQDEFTP']
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_negative_index(self):
+        seq_ds = SequenceDataset(mock_proteins(self.sequences), self.tmpdir.name, 'mock', verbosity=0)
+        self.assertEqual(seq_ds[-1]['sequence'].tolist(), tokenize(self.sequences[-1]).tolist())
+        self.assertEqual(seq_ds[-1]['id'], len(self.sequences) - 1)
+        self.assertEqual(seq_ds[-len(self.sequences)]['sequence'].tolist(), tokenize(self.sequences[0]).tolist())
+        with self.assertRaises(IndexError):
+            seq_ds[len(self.sequences)]
+        with self.assertRaises(IndexError):
+            seq_ds[-len(self.sequences) - 1]
+
+    def test_chunked_build(self):
+        with unittest.mock.patch('proteinshake.representations.sequence.chunk_size', 2):
+            seq_ds = SequenceDataset(mock_proteins(self.sequences), self.tmpdir.name, 'mock', verbosity=0)
+        self.assertEqual(seq_ds.strings(), self.sequences)
+        self.assertEqual(seq_ds.offsets.tolist(), [0, 5, 11, 20])
+
+    def test_different_transform(self):
+        SequenceDataset(mock_proteins(self.sequences), self.tmpdir.name, 'mock', transform=IdentityTransform(), verbosity=0)
+        with self.assertRaises(Exception):
+            SequenceDataset(mock_proteins(self.sequences), self.tmpdir.name, 'mock', transform=TruncateTransform(), verbosity=0)
+
+    def test_different_transform_parameters(self):
+        SequenceDataset(mock_proteins(self.sequences), self.tmpdir.name, 'mock', transform=TruncateTransform(n=3), verbosity=0)
+        SequenceDataset(mock_proteins(self.sequences), self.tmpdir.name, 'mock', transform=TruncateTransform(n=3), verbosity=0)
+        with self.assertRaises(Exception):
+            SequenceDataset(mock_proteins(self.sequences), self.tmpdir.name, 'mock', transform=TruncateTransform(n=5), verbosity=0)
+
+    def test_different_size(self):
+        SequenceDataset(mock_proteins(self.sequences), self.tmpdir.name, 'mock', verbosity=0)
+        with self.assertRaises(Exception):
+            SequenceDataset(mock_proteins(self.sequences[:2]), self.tmpdir.name, 'mock', verbosity=0)
+
+
+class TestTokenize(unittest.TestCase):
+
+    def test_residue_tokens_match_alphabet(self):
+        sequence = 'MKVLAAGIVALLLAAGCSSWYHNRQDEFTP'
+        tokens = tokenize(sequence, resolution='residue')
+        self.assertEqual(tokens.tolist(), [residue_alphabet.index(aa) for aa in sequence])
+
+    def test_residue_list_input(self):
+        sequence = ['M', 'K', 'V']
+        self.assertEqual(tokenize(sequence).tolist(), tokenize('MKV').tolist())
+
+    def test_unknown_residue(self):
+        with self.assertRaises(ValueError):
+            tokenize('MKXV')
+
+    def test_atom_tokens_use_element(self):
+        atoms = ['N', 'CA', 'C', 'O', 'CB', 'SG', 'HA']
+        tokens = tokenize(atoms, resolution='atom')
+        self.assertEqual(tokens.tolist(), [atom_alphabet.index(a[0]) for a in atoms])
+
 
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file